@@ -0,0 +1,134 @@
+# scripts/_compose.py
+# Определение команды docker compose для служебных скриптов (health_check.py, backup_db.py).
+#
+# Логика живёт в одном месте, потому что оба скрипта пользуются общим кэшем
+# на диске (COMPOSE_CACHE_FILE) и должны одинаково понимать его формат.
+#
+# Переменная окружения DOCKER_COMPOSE_CMD (например, "docker compose" или "docker-compose")
+# задаёт команду compose явно: поиск и проверка `docker compose version` тогда пропускаются.
+#
+# Кэш сбрасывается сам только при обновлении бинарника docker. Если ты поменял compose
+# (удалил/поставил плагин v2 или docker-compose v1) без обновления Docker — удали
+# ~/.cache/viking-rise-wiki/compose.json, иначе скрипты продолжат брать старую команду.
+
+import functools
+import json
+import os
+import shlex
+import shutil
+import subprocess
+from typing import Optional
+
+try:
+    from ._paths import COMPOSE_CACHE_FILE
+except ImportError:
+    from _paths import COMPOSE_CACHE_FILE
+
+
+def read_compose_cache(docker_path: str) -> Optional[list]:
+    """
+    Читаем закэшированную команду compose.
+    Кэш считается валидным, только если:
+    - путь к docker не поменялся;
+    - mtime бинарника docker совпадает (после обновления Docker кэш сбрасывается);
+    - команда — ровно одна из тех, что мы сами могли найти:
+      [docker_path, "compose"] или [путь к docker-compose из PATH].
+    Последняя проверка важна для безопасности: файл кэша лежит в профиле пользователя
+    и доступен на запись без прав администратора, а скрипты работают с повышенными
+    правами. Произвольную команду из кэша мы не запустим никогда.
+    Любая проблема с файлом кэша — просто промах (None).
+    """
+    try:
+        cached = json.loads(COMPOSE_CACHE_FILE.read_text(encoding="utf-8"))
+        if (
+            cached["docker_path"] != docker_path
+            or cached["docker_mtime_ns"] != os.stat(docker_path).st_mtime_ns
+        ):
+            return None
+
+        cmd = cached["cmd"]
+        if cmd == [docker_path, "compose"]:
+            return [docker_path, "compose"]
+
+        compose_v1_path = shutil.which("docker-compose")
+        if compose_v1_path is not None and cmd == [compose_v1_path]:
+            return [compose_v1_path]
+    except Exception:
+        pass
+    return None
+
+
+def write_compose_cache(docker_path: str, cmd: list) -> None:
+    """Сохраняем найденную команду compose; ошибки записи кэша не критичны."""
+    try:
+        COMPOSE_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        COMPOSE_CACHE_FILE.write_text(
+            json.dumps(
+                {
+                    "docker_path": docker_path,
+                    "docker_mtime_ns": os.stat(docker_path).st_mtime_ns,
+                    "cmd": cmd,
+                }
+            ),
+            encoding="utf-8",
+        )
+    except Exception:
+        pass
+
+
+@functools.lru_cache(maxsize=1)
+def find_compose_command() -> list:
+    """
+    Определяем, какую команду использовать для docker compose:
+    - Если задана переменная окружения DOCKER_COMPOSE_CMD — берём её как есть, без проверок.
+    - Иначе смотрим кэш на диске (COMPOSE_CACHE_FILE), чтобы не запускать docker лишний раз.
+    - Затем пробуем `docker compose` (v2).
+    - Если не получилось, пробуем `docker-compose` (v1).
+    Возвращаем список аргументов для subprocess.run, например:
+      ["docker", "compose"] или ["docker-compose"].
+    В пределах процесса результат дополнительно кэшируется через lru_cache.
+    """
+    # Явная команда от администратора: никаких подпроцессов и обращений к кэшу.
+    # На Windows shlex работает в не-POSIX режиме (чтобы не съедать '\' в путях),
+    # поэтому кавычки вокруг пути снимаем сами.
+    env_cmd = os.environ.get("DOCKER_COMPOSE_CMD", "").strip()
+    if env_cmd:
+        return [part.strip('"') for part in shlex.split(env_cmd, posix=os.name != "nt")]
+
+    # Проверяем наличие docker
+    docker_path = shutil.which("docker")
+    if docker_path is None:
+        raise RuntimeError("Docker не найден в PATH. Установи Docker Desktop и попробуй снова.")
+
+    cached_cmd = read_compose_cache(docker_path)
+    if cached_cmd is not None:
+        return cached_cmd
+
+    # Пробуем docker compose (v2).
+    # close_fds=False: все дескрипторы Python и так создаёт ненаследуемыми (PEP 446),
+    # а без закрытия ребёнку не нужно перебирать таблицу fd перед exec.
+    try:
+        result = subprocess.run(
+            [docker_path, "compose", "version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            close_fds=False,
+        )
+        if result.returncode == 0:
+            write_compose_cache(docker_path, [docker_path, "compose"])
+            return [docker_path, "compose"]
+    except Exception:
+        pass
+
+    # Пробуем docker-compose (v1)
+    compose_v1_path = shutil.which("docker-compose")
+    if compose_v1_path is not None:
+        write_compose_cache(docker_path, [compose_v1_path])
+        return [compose_v1_path]
+
+    # Если ни один вариант не доступен — ошибку наверх
+    raise RuntimeError(
+        "Не найден ни 'docker compose', ни 'docker-compose'. "
+        "Установи Docker Compose v2 или v1 и повтори попытку."
+    )
@@ -0,0 +1,23 @@
+# scripts/_paths.py
+# Общие пути проекта для служебных скриптов (health_check.py, backup_db.py).
+#
+# Корень вычисляется один раз при импорте: Path.resolve() ходит по симлинкам
+# (несколько stat/lstat), и нет смысла повторять это в каждом main().
+# Скрипты импортируют модуль относительно (`from ._paths import ...`), когда их
+# запускают как `python -m scripts.<имя>` или импортируют как scripts.<имя>,
+# и как `from _paths import ...` при запуске `python scripts/<имя>.py`.
+
+from pathlib import Path
+
+# Корень репозитория — на уровень выше папки scripts/
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+COMPOSE_FILE = ROOT_DIR / "docker-compose.yml"
+ENV_FILE = ROOT_DIR / ".env"
+DATA_DIR = ROOT_DIR / "data"
+BACKUPS_DIR = ROOT_DIR / "backups"
+LOGS_DIR = ROOT_DIR / "logs"
+
+# Файл кэша найденной команды compose (общий для обоих скриптов).
+# Удали его, если хочешь принудительно перепроверить docker compose.
+COMPOSE_CACHE_FILE = Path.home() / ".cache" / "viking-rise-wiki" / "compose.json"
@@ -6,21 +6,51 @@
 #  - Проверяет запуск от имени администратора.
 #  - Читает .env и вытаскивает POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DB.
 #  - Создаёт папку backups/ в корне проекта.
-#  - Вызывает pg_dump внутри контейнера db через docker compose exec -T.
-#  - Сохраняет дамп в файл вида wikijs_db_YYYYMMDD_HHMMSS.sql.
+#  - Вызывает pg_dump внутри контейнера db через docker exec
+#    (или docker compose exec -T, если контейнер не удалось найти напрямую).
+#  - Сжимает дамп на лету (gzip) и сохраняет в файл вида wikijs_db_YYYYMMDD_HHMMSS.sql.gz.
 #  - Ведёт логи в консоль и logs/backup.log, удаляя старые записи по мере ротации.
 #
 # Лог выводится в консоль и в файл logs/backup.log.
+#
+# Переменная окружения DOCKER_COMPOSE_CMD (например, "docker compose") задаёт команду
+# compose явно — тогда проверка `docker compose version` не выполняется вовсе.
 
+import gzip
+import heapq
 import logging
 import os
+import re
 import sys
 import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
 import shutil
-from datetime import datetime
 import platform
 
+# Относительный импорт — для `python -m scripts.<имя>` и импорта из планировщика,
+# обычный — для запуска `python scripts/<имя>.py` (тогда scripts/ лежит в sys.path).
+try:
+    from ._compose import find_compose_command
+    from ._paths import BACKUPS_DIR, ENV_FILE, LOGS_DIR, ROOT_DIR
+except ImportError:
+    from _compose import find_compose_command
+    from _paths import BACKUPS_DIR, ENV_FILE, LOGS_DIR, ROOT_DIR
+
+
+def _write_err(text: str) -> None:
+    """
+    Пишем сообщение в stderr прямым write, без обвязки print() (разбор kwargs, sep/end).
+    sys.stderr берём в момент вызова: он мог быть перенаправлен (redirect_stderr, тесты)
+    или отсутствовать вовсе (None под pythonw на Windows).
+    """
+    stream = sys.stderr
+    if stream is not None:
+        stream.write(text)
+
 
 def is_admin() -> bool:
     """Та же проверка прав, что и в health_check.py."""
@@ -34,34 +64,68 @@ def is_admin() -> bool:
         return False
 
 
-def find_compose_command() -> list:
-    """Определяем команду для docker compose (v2 или v1)."""
-    docker_path = shutil.which("docker")
-    if docker_path is None:
-        raise RuntimeError("Docker не найден в PATH. Установи Docker Desktop и попробуй снова.")
+def compose_project_name(root_dir: Path, env_vars: dict) -> str:
+    """
+    Имя compose-проекта так, как его вычисляет сам docker compose:
+    COMPOSE_PROJECT_NAME из окружения, затем из .env проекта, иначе имя папки.
+    Имя приводится к нижнему регистру, недопустимые символы выкидываются,
+    ведущие '-' и '_' обрезаются.
+    """
+    name = (
+        os.environ.get("COMPOSE_PROJECT_NAME")
+        or env_vars.get("COMPOSE_PROJECT_NAME")
+        or root_dir.name
+    )
+    return re.sub(r"[^a-z0-9_-]", "", name.lower()).lstrip("-_")
+
 
-    # Пробуем docker compose (v2)
+def resolve_container_id(
+    docker_path: str, root_dir: Path, env_vars: dict, service: str = "db"
+) -> Optional[str]:
+    """
+    Ищем ID запущенного контейнера сервиса по меткам compose через `docker ps`.
+    Так pg_dump можно запустить обычным `docker exec`, не поднимая compose CLI
+    (разбор YAML, поиск проекта и т.п.). Если найти не удалось — возвращаем None.
+    """
     try:
         result = subprocess.run(
-            [docker_path, "compose", "version"],
+            [
+                docker_path,
+                "ps",
+                "-q",
+                "--filter",
+                f"label=com.docker.compose.service={service}",
+                "--filter",
+                f"label=com.docker.compose.project={compose_project_name(root_dir, env_vars)}",
+            ],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
+            close_fds=False,
         )
-        if result.returncode == 0:
-            return [docker_path, "compose"]
     except Exception:
-        pass
+        return None
 
-    # Пробуем docker-compose (v1)
-    compose_v1_path = shutil.which("docker-compose")
-    if compose_v1_path is not None:
-        return [compose_v1_path]
+    if result.returncode != 0:
+        return None
 
-    raise RuntimeError(
-        "Не найден ни 'docker compose', ни 'docker-compose'. "
-        "Установи Docker Compose и повтори попытку."
-    )
+    lines = result.stdout.split()
+    return lines[0] if lines else None
+
+
+# Регулярка для строк вида KEY=VALUE с нужными ключами (COMPOSE_PROJECT_NAME — необязательный,
+# нужен, чтобы найти контейнер db по меткам compose). Весь файл разбирается одним
+# проходом findall (цикл идёт в C, а не в Python). Разделители — только пробел/таб,
+# чтобы пустое значение не «перепрыгнуло» на следующую строку. '#' внутри значения
+# сохраняется: пароль вполне может его содержать.
+_ENV_RE = re.compile(
+    r"(?m)^[ \t]*(POSTGRES_USER|POSTGRES_PASSWORD|POSTGRES_DB|COMPOSE_PROJECT_NAME)[ \t]*=[ \t]*(.*?)[ \t\r]*$"
+)
+
+# Кэш разобранного .env: ключ — (путь, mtime_ns, размер), значение — словарь переменных.
+# Если скрипт импортирует планировщик и вызывает main() повторно, .env не перечитывается,
+# пока файл не изменится.
+_ENV_CACHE: dict[tuple, dict] = {}
 
 
 def load_env_vars(env_path: Path) -> dict:
@@ -72,32 +136,35 @@ def load_env_vars(env_path: Path) -> dict:
       - POSTGRES_USER
       - POSTGRES_PASSWORD
       - POSTGRES_DB
+    и необязательной COMPOSE_PROJECT_NAME.
+    Результат кэшируется в _ENV_CACHE до изменения файла.
     """
     required_keys = {"POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB"}
-    values: dict = {}
-
-    if not env_path.is_file():
-        raise FileNotFoundError(f"Файл .env не найден по пути: {env_path}")
-
-    with env_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            # Пропускаем пустые строки и комментарии
-            if not line or line.startswith("#"):
-                continue
-            if "=" not in line:
-                continue
-            key, val = line.split("=", 1)
-            key = key.strip()
-            val = val.strip()
-            if key in required_keys:
-                values[key] = val
+
+    # EAFP: stat() и есть проверка существования — отдельный is_file() не нужен
+    try:
+        st = env_path.stat()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Файл .env не найден по пути: {env_path}") from None
+
+    cache_key = (str(env_path), st.st_mtime_ns, st.st_size)
+    # Проверяем именно наличие ключа: закэшированный результат может быть и пустым
+    if cache_key in _ENV_CACHE:
+        values = _ENV_CACHE[cache_key]
+    else:
+        # Комментарии и пустые строки регулярка не совпадёт; при повторе ключа побеждает последний
+        values = dict(_ENV_RE.findall(env_path.read_text(encoding="utf-8")))
+        _ENV_CACHE[cache_key] = values
 
     missing = required_keys - set(values.keys())
     if missing:
         raise ValueError(f"В .env отсутствуют необходимые переменные: {', '.join(missing)}")
 
-    return values
+    return dict(values)
+
+
+# Сброс кэша .env (удобно в тестах и при ручной отладке)
+load_env_vars.cache_clear = _ENV_CACHE.clear
 
 
 def setup_logger(log_dir: Path) -> logging.Logger:
@@ -133,44 +200,147 @@ def rotate_backups(backups_dir: Path, keep_last: int, logger: logging.Logger) ->
     Остальные аккуратно удаляем с логированием, чтобы не копить гигабайты.
     """
 
-    backup_files = sorted(
-        backups_dir.glob("wikijs_db_*.sql"),
-        key=lambda file_path: file_path.stat().st_mtime,
-        reverse=True,
-    )
-
-    if len(backup_files) <= keep_last:
+    # Учитываем и сжатые (.sql.gz), и старые несжатые (.sql) дампы.
+    # os.scandir отдаёт DirEntry вместе с данными каталога: на Windows stat() уже
+    # закэширован, а Path-объекты для каждого файла не создаются.
+    with os.scandir(backups_dir) as it:
+        entries = [
+            entry
+            for entry in it
+            if entry.name.startswith("wikijs_db_")
+            and entry.name.endswith((".sql", ".sql.gz"))
+        ]
+
+    if len(entries) <= keep_last:
         return
 
-    for obsolete_file in backup_files[keep_last:]:
+    # Полная сортировка не нужна: достаточно выбрать keep_last самых свежих.
+    # heapq.nlargest — O(N log K) вместо O(N log N), заметно при годах ежедневных бэкапов.
+    keep_paths = {
+        entry.path
+        for entry in heapq.nlargest(keep_last, entries, key=lambda entry: entry.stat().st_mtime)
+    }
+    obsolete_paths = [entry.path for entry in entries if entry.path not in keep_paths]
+
+    def _try_unlink(path: str) -> None:
         try:
-            obsolete_file.unlink()
-            logger.info("Удалён старый бэкап: %s", obsolete_file)
+            os.unlink(path)
+            logger.info("Удалён старый бэкап: %s", path)
         except Exception as e:
-            logger.warning("Не удалось удалить %s: %s", obsolete_file, e)
+            logger.warning("Не удалось удалить %s: %s", path, e)
+
+    # Удаляем параллельно: на сетевых дисках (SMB/NFS) каждый unlink — отдельный
+    # round trip, и последовательное удаление сотни файлов заметно тормозит.
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(_try_unlink, obsolete_paths))
+
+
+def copy_stream(src, dst, buffer_size: int = 1 << 20) -> None:
+    """
+    Копирует поток src в dst через один заранее выделенный буфер.
+    В отличие от shutil.copyfileobj, не создаёт новый объект bytes на каждый мегабайт:
+    readinto() пишет прямо в буфер, а dst получает срез memoryview без копирования.
+    """
+
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        n = src.readinto(buffer)
+        if not n:
+            break
+        dst.write(view[:n])
+
+
+def dump_to_gzip(cmd: list, cwd: Path, backup_file: Path) -> tuple:
+    """
+    Запускает pg_dump и сжимает его вывод в gzip прямо по ходу чтения из pipe.
+    Память не растёт с размером БД, а на диск пишется в разы меньше байт.
+    Дамп пишется во временный файл <имя>.partial и переименовывается в backup_file
+    только при успехе — недописанный архив никогда не попадёт в ротацию.
+    При любой ошибке (pg_dump, нехватка места, исключение) .partial удаляется.
+    Возвращает (код возврата, stderr в байтах).
+    """
+
+    partial_file = backup_file.with_name(backup_file.name + ".partial")
+    completed = False
+    try:
+        # stderr пишем во временный файл, чтобы переполненный pipe не заблокировал pg_dump,
+        # пока мы читаем stdout
+        with open(partial_file, "wb") as raw, tempfile.TemporaryFile() as err_file:
+            proc = subprocess.Popen(
+                cmd,
+                cwd=cwd,
+                stdout=subprocess.PIPE,
+                stderr=err_file,
+                close_fds=False,
+            )
+            try:
+                # Уровень 6 — как у утилиты gzip: заметно быстрее 9-го при почти том же размере.
+                # filename задаём явно, иначе в заголовок попадёт имя .partial-файла
+                # (GzipFile сам отрежет .gz и запишет wikijs_db_….sql).
+                with proc.stdout, gzip.GzipFile(
+                    filename=backup_file.name,
+                    mode="wb",
+                    compresslevel=6,
+                    fileobj=raw,
+                ) as gz:
+                    copy_stream(proc.stdout, gz)
+            except BaseException:
+                # Ошибка записи (например, кончилось место) — не оставляем pg_dump висеть
+                proc.kill()
+                proc.wait()
+                raise
+            returncode = proc.wait()
+
+            # Дамп повторно читать не будем — просим ядро не держать его в page cache
+            # (только на POSIX, на Windows такой функции нет). fsync нужен, потому что
+            # DONTNEED выкидывает только уже записанные на диск страницы.
+            if hasattr(os, "posix_fadvise"):
+                try:
+                    raw.flush()
+                    os.fsync(raw.fileno())
+                    os.posix_fadvise(raw.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+                except OSError:
+                    pass
+
+            err_file.seek(0)
+            stderr = err_file.read()
+
+        # Переименовываем уже после закрытия файла (на Windows открытый файл не переименовать)
+        if returncode == 0:
+            os.replace(partial_file, backup_file)
+            completed = True
+    finally:
+        if not completed:
+            try:
+                os.unlink(partial_file)
+            except OSError:
+                pass
+
+    return returncode, stderr
 
 
 def main() -> int:
     # Проверка прав
     if not is_admin():
-        print("[ERROR] Скрипт должен выполняться от имени администратора.", file=sys.stderr)
+        _write_err("[ERROR] Скрипт должен выполняться от имени администратора.\n")
         if os.name == "nt":
-            print("        Запусти терминал (PowerShell / CMD) 'От имени администратора' и повтори.", file=sys.stderr)
+            _write_err("        Запусти терминал (PowerShell / CMD) 'От имени администратора' и повтори.\n")
         else:
-            print("        Запусти: sudo python scripts/backup_db.py", file=sys.stderr)
+            _write_err("        Запусти: sudo python scripts/backup_db.py\n")
         return 1
 
-    root_dir = Path(__file__).resolve().parents[1]
-    logger = setup_logger(root_dir / "logs")
+    root_dir = ROOT_DIR
+    logger = setup_logger(LOGS_DIR)
 
     logger.info("=== Резервное копирование БД Wiki.js ===")
     logger.info("OS: %s %s", platform.system(), platform.release())
     logger.info("Корень проекта: %s", root_dir)
 
-    env_path = root_dir / ".env"
+    env_path = ENV_FILE
     try:
         env_vars = load_env_vars(env_path)
-    except (FileNotFoundError, ValueError) as e:
+    except (OSError, ValueError) as e:
         logger.error("%s", e)
         return 1
 
@@ -178,7 +348,7 @@ def main() -> int:
     postgres_db = env_vars["POSTGRES_DB"]
 
     # Папка для бэкапов
-    backups_dir = root_dir / "backups"
+    backups_dir = BACKUPS_DIR
     try:
         backups_dir.mkdir(parents=True, exist_ok=True)
         logger.info("Папка для бэкапов: %s", backups_dir)
@@ -186,8 +356,8 @@ def main() -> int:
         logger.error("Не удалось создать папку для бэкапов: %s", e)
         return 1
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_file = backups_dir / f"wikijs_db_{timestamp}.sql"
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    backup_file = backups_dir / f"wikijs_db_{timestamp}.sql.gz"
     logger.info("Файл бэкапа: %s", backup_file)
 
     # Ищем docker compose / docker-compose
@@ -198,19 +368,32 @@ def main() -> int:
         logger.error("%s", e)
         return 1
 
-    # Команда pg_dump внутри контейнера db:
+    # Команда pg_dump внутри контейнера db. Быстрый путь — напрямую через docker exec:
+    # docker exec <container-id> pg_dump -U <user> <db>
+    # Если контейнер не нашёлся по меткам — как раньше:
     # docker compose exec -T db pg_dump -U <user> <db>
-    cmd = [*compose_cmd, "exec", "-T", "db", "pg_dump", "-U", postgres_user, postgres_db]
+    docker_path = shutil.which("docker")
+    container_id = None
+    if docker_path is not None:
+        container_id = resolve_container_id(docker_path, root_dir, env_vars)
+
+    if container_id is not None:
+        logger.info("Контейнер db: %s (docker exec)", container_id)
+        cmd = [
+            docker_path,
+            "exec",
+            container_id,
+            "pg_dump",
+            "-U",
+            postgres_user,
+            postgres_db,
+        ]
+    else:
+        logger.info("Контейнер db не найден через docker ps, используем compose exec.")
+        cmd = [*compose_cmd, "exec", "-T", "db", "pg_dump", "-U", postgres_user, postgres_db]
 
     try:
-        with backup_file.open("w", encoding="utf-8") as f:
-            proc = subprocess.run(
-                cmd,
-                cwd=root_dir,
-                stdout=f,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
+        returncode, stderr = dump_to_gzip(cmd, root_dir, backup_file)
     except FileNotFoundError as e:
         logger.error("Не удалось запустить docker compose: %s", e)
         return 1
@@ -218,17 +401,11 @@ def main() -> int:
         logger.error("Неожиданная ошибка при выполнении pg_dump: %s", e)
         return 1
 
-    if proc.returncode != 0:
-        # Если pg_dump отдал ошибку — удаляем пустой/битый файл и выводим stderr
-        try:
-            if backup_file.exists():
-                backup_file.unlink()
-        except Exception:
-            pass
-
+    if returncode != 0:
+        # Недописанный .partial уже удалён в dump_to_gzip — выводим stderr
         logger.error("pg_dump завершился с ошибкой")
-        if proc.stderr:
-            logger.error(proc.stderr)
+        if stderr:
+            logger.error(stderr.decode("utf-8", errors="replace"))
         logger.info(
             "Убедись, что контейнер 'db' запущен и переменные окружения указаны корректно."
         )
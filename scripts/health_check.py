@@ -10,14 +10,28 @@
 #  - Показывает статус контейнеров через docker compose ps.
 #
 # Лог выводится в консоль.
+#
+# Переменная окружения DOCKER_COMPOSE_CMD (например, "docker compose" или "docker-compose")
+# задаёт команду compose явно: поиск и проверка `docker compose version` тогда пропускаются.
 
+import http.client
+import itertools
 import os
+import re
 import sys
 import subprocess
 import platform
 from pathlib import Path
-import shutil
-from urllib import error, request
+from urllib.parse import urlsplit
+
+# Относительный импорт — для `python -m scripts.<имя>` и импорта из планировщика,
+# обычный — для запуска `python scripts/<имя>.py` (тогда scripts/ лежит в sys.path).
+try:
+    from ._compose import find_compose_command
+    from ._paths import COMPOSE_FILE, DATA_DIR, ENV_FILE, ROOT_DIR
+except ImportError:
+    from _compose import find_compose_command
+    from _paths import COMPOSE_FILE, DATA_DIR, ENV_FILE, ROOT_DIR
 
 
 def is_admin() -> bool:
@@ -39,114 +53,124 @@ def is_admin() -> bool:
         return False
 
 
+# Регулярка для строк вида KEY=VALUE: весь файл разбирается одним проходом findall.
+# Ключ не может начинаться с '#', поэтому комментарии пропускаются автоматически.
+# Разделители — только пробел/таб, чтобы пустое значение не захватило следующую строку.
+_ENV_RE = re.compile(r"(?m)^[ \t]*([^#\s=][^=\r\n]*?)[ \t]*=[ \t]*(.*?)[ \t\r]*$")
+
+# Кэш разобранного .env: ключ — (путь, mtime_ns, размер), значение — словарь переменных.
+# Повторные вызовы в одном процессе (например, из планировщика) не перечитывают файл,
+# пока он не изменится.
+_ENV_CACHE: dict[tuple, dict] = {}
+
+
 def load_env_vars(env_path: Path) -> dict:
     """
     Простейший парсер .env:
     - интересуемся только PUBLIC_HTTP_PORT для HTTP-проверки Nginx.
     - игнорируем пустые строки и комментарии.
     Возвращаем словарь переменных, если файл найден и корректен.
+    Если файла нет — FileNotFoundError (main() превращает его в WARN).
+    Результат кэшируется в _ENV_CACHE до изменения файла.
     """
-    values: dict = {}
+    # EAFP: stat() одновременно проверяет существование и даёт ключ для кэша
+    st = env_path.stat()
+    cache_key = (str(env_path), st.st_mtime_ns, st.st_size)
+    # Проверяем именно наличие ключа: пустой .env тоже считается закэшированным
+    if cache_key in _ENV_CACHE:
+        return dict(_ENV_CACHE[cache_key])
 
-    if not env_path.is_file():
-        return values
+    values = dict(_ENV_RE.findall(env_path.read_text(encoding="utf-8")))
+    _ENV_CACHE[cache_key] = values
+    return dict(values)
 
-    with env_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            if "=" not in line:
-                continue
-            key, val = line.split("=", 1)
-            values[key.strip()] = val.strip()
 
-    return values
+# Сброс кэша .env (удобно в тестах и при ручной отладке)
+load_env_vars.cache_clear = _ENV_CACHE.clear
 
 
-def find_compose_command() -> list:
-    """
-    Определяем, какую команду использовать для docker compose:
-    - Сначала пробуем `docker compose` (v2).
-    - Если не получилось, пробуем `docker-compose` (v1).
-    Возвращаем список аргументов для subprocess.run, например:
-      ["docker", "compose"] или ["docker-compose"].
+def check_http_endpoint(url: str, warn=None) -> bool:
     """
-    # Проверяем наличие docker
-    docker_path = shutil.which("docker")
-    if docker_path is None:
-        raise RuntimeError("Docker не найден в PATH. Установи Docker Desktop и попробуй снова.")
-
-    # Пробуем docker compose (v2)
-    try:
-        result = subprocess.run(
-            [docker_path, "compose", "version"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        if result.returncode == 0:
-            return [docker_path, "compose"]
-    except Exception:
-        pass
-
-    # Пробуем docker-compose (v1)
-    compose_v1_path = shutil.which("docker-compose")
-    if compose_v1_path is not None:
-        return [compose_v1_path]
-
-    # Если ни один вариант не доступен — ошибку наверх
-    raise RuntimeError(
-        "Не найден ни 'docker compose', ни 'docker-compose'. "
-        "Установи Docker Compose v2 или v1 и повтори попытку."
-    )
-
-
-def check_http_endpoint(url: str) -> bool:
-    """
-    Делает быстрый HTTP-запрос к Nginx.
+    Делает быстрый HEAD-запрос к Nginx через http.client:
+    тело страницы не скачивается, редиректы не отслеживаются (302 тоже считается успехом).
     Возвращает True, если ответ с кодом < 400.
     Любая ошибка соединения/HTTP приведёт к False, но не оборвёт выполнение.
+    Текст предупреждения (без префикса уровня) передаётся в warn(text);
+    по умолчанию печатается в stderr как [WARN].
     """
 
+    if warn is None:
+        def warn(text: str) -> None:
+            print(f"[WARN] {text}", file=sys.stderr)
+
     try:
-        with request.urlopen(url, timeout=5) as response:
-            return response.status < 400
-    except error.HTTPError as http_err:
-        print(
-            f"[WARN] HTTP {http_err.code} от {url}. "
-            "Проверь, что Nginx и Wiki.js подняты и отдают контент.",
-            file=sys.stderr,
+        parts = urlsplit(url)
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=5)
+        try:
+            conn.request("HEAD", parts.path or "/")
+            status = conn.getresponse().status
+        finally:
+            conn.close()
+
+        if status < 400:
+            return True
+        warn(
+            f"HTTP {status} от {url}. "
+            "Проверь, что Nginx и Wiki.js подняты и отдают контент."
         )
-    except error.URLError as url_err:
-        print(
-            f"[WARN] Не удалось подключиться к {url}: {url_err.reason}. "
-            "Проверь docker compose up и порты.",
-            file=sys.stderr,
+    except OSError as conn_err:
+        # Сюда попадают отказ в соединении, таймаут и прочие сетевые ошибки
+        warn(
+            f"Не удалось подключиться к {url}: {conn_err}. "
+            "Проверь docker compose up и порты."
         )
     except Exception as e:
-        print(
-            f"[WARN] Неожиданная ошибка при HTTP-проверке {url}: {e}",
-            file=sys.stderr,
-        )
+        warn(f"Неожиданная ошибка при HTTP-проверке {url}: {e}")
 
     return False
 
 
 def main() -> int:
     status_counters = {"OK": 0, "WARN": 0, "ERROR": 0}
+    # Строки лога копим в памяти как (поток, текст) и выводим в конце:
+    # несколько крупных write() вместо отдельного print на каждую строку.
+    pending_output: list = []
 
     def log(level: str, message: str) -> None:
         """
         Упрощённый логгер, чтобы в конце показать сводку статусов.
         INFO считаем информацией, а OK/WARN/ERROR учитываем в подсчёте.
+        Счётчики обновляются сразу, сам текст попадает в pending_output.
         """
 
         target = sys.stderr if level in ("ERROR", "WARN") else sys.stdout
-        print(f"[{level}] {message}", file=target)
+        pending_output.append((target, f"[{level}] {message}\n"))
         if level in status_counters:
             status_counters[level] += 1
 
+    def flush_output() -> None:
+        """
+        Выводим накопленный лог. Подряд идущие строки одного потока склеиваем
+        в один write(), поэтому порядок stdout/stderr в консоли сохраняется.
+        """
+
+        for target, chunk in itertools.groupby(pending_output, key=lambda item: item[0]):
+            target.write("".join(text for _, text in chunk))
+            target.flush()
+        pending_output.clear()
+
+    try:
+        return run_checks(log, pending_output, status_counters)
+    finally:
+        flush_output()
+
+
+def run_checks(log, pending_output: list, status_counters: dict) -> int:
+    """
+    Сами проверки инфраструктуры. Вынесены из main(), чтобы main() гарантированно
+    вывел накопленный лог при любом выходе (в том числе по return 1).
+    """
+
     # Проверяем права администратора / root
     if not is_admin():
         log("ERROR", "Скрипт должен выполняться от имени администратора.")
@@ -159,45 +183,64 @@ def main() -> int:
             log("WARN", "Запусти: sudo python scripts/health_check.py")
         return 1
 
-    print("=== Health-check viking-rise-wiki-infra ===")
+    pending_output.append((sys.stdout, "=== Health-check viking-rise-wiki-infra ===\n"))
     log("INFO", f"OS: {platform.system()} {platform.release()}")
 
-    # Корень проекта — две директории выше относительно текущего файла
-    root_dir = Path(__file__).resolve().parents[1]
+    # Корень проекта вычислен один раз в _paths.py
+    root_dir = ROOT_DIR
     log("INFO", f"Корень проекта: {root_dir}")
 
+    # Одно чтение корня проекта вместо отдельного stat на каждый файл.
+    # DirEntry.is_file()/is_dir() берут тип из самого листинга каталога.
+    try:
+        with os.scandir(root_dir) as it:
+            root_entries = {entry.name: entry for entry in it}
+    except OSError as e:
+        log("ERROR", f"Не удалось прочитать корень проекта {root_dir}: {e}")
+        return 1
+
     # Проверяем наличие docker-compose.yml
-    compose_file = root_dir / "docker-compose.yml"
-    if not compose_file.is_file():
+    compose_entry = root_entries.get(COMPOSE_FILE.name)
+    if compose_entry is None or not compose_entry.is_file():
         log("ERROR", "Не найден docker-compose.yml в корне проекта.")
         return 1
     log("OK", "Найден docker-compose.yml")
 
     # Проверяем .env (не обязательно, но полезно)
-    env_file = root_dir / ".env"
-    env_vars = load_env_vars(env_file)
-
-    if not env_file.is_file():
+    env_vars = {}
+    if ENV_FILE.name not in root_entries:
         log("WARN", "Файл .env не найден.")
         log("WARN", "Создай его из .env.example и заполни своими значениями.")
     else:
-        log("OK", "Найден .env")
-
-    # Проверяем/создаём папки data/db и data/wiki
-    db_dir = root_dir / "data" / "db"
-    wiki_dir = root_dir / "data" / "wiki"
-
-    for folder in (db_dir, wiki_dir):
-        if not folder.exists():
-            log("WARN", f"Папка {folder} отсутствует, создаю...")
-            try:
-                folder.mkdir(parents=True, exist_ok=True)
-                log("OK", f"Папка {folder} создана.")
-            except Exception as e:
-                log("ERROR", f"Не удалось создать папку {folder}: {e}")
-                return 1
-        else:
+        try:
+            env_vars = load_env_vars(ENV_FILE)
+            log("OK", "Найден .env")
+        except OSError as e:
+            log("WARN", f"Не удалось прочитать .env: {e}")
+
+    # Проверяем/создаём папки data/db и data/wiki — всегда, даже если Docker недоступен.
+    # Одно чтение data/ отвечает сразу за обе папки; создаём только недостающие
+    try:
+        with os.scandir(DATA_DIR) as it:
+            data_entries = {entry.name: entry for entry in it}
+    except FileNotFoundError:
+        data_entries = {}
+    except OSError as e:
+        log("ERROR", f"Не удалось прочитать папку {DATA_DIR}: {e}")
+        return 1
+
+    for name in ("db", "wiki"):
+        folder = DATA_DIR / name
+        entry = data_entries.get(name)
+        if entry is not None and entry.is_dir():
             log("OK", f"Папка {folder} существует.")
+            continue
+        try:
+            os.makedirs(folder, exist_ok=True)
+        except Exception as e:
+            log("ERROR", f"Не удалось создать папку {folder}: {e}")
+            return 1
+        log("WARN", f"Папка {folder} отсутствовала, создана.")
 
     # Определяем команду для compose
     try:
@@ -207,20 +250,23 @@ def main() -> int:
         log("ERROR", str(e))
         return 1
 
-    # Показываем статус контейнеров (docker compose ps)
+    public_port = env_vars.get("PUBLIC_HTTP_PORT", "80")
+    target_url = f"http://localhost:{public_port}"
+
+    # docker compose ps и HTTP-проверка Nginx не зависят друг от друга, поэтому
+    # ps запускаем в фоне через Popen, а HTTP-проверку делаем в основном потоке,
+    # пока ps работает. Итоговое время — максимум из двух операций, а не сумма.
+    # Потоков нет, так что при раннем выходе ждать нечего.
+    log("INFO", "Проверяю статус контейнеров (docker compose ps)...")
     try:
-        log("INFO", "Проверяю статус контейнеров (docker compose ps)...")
-        ps_result = subprocess.run(
+        ps_proc = subprocess.Popen(
             [*compose_cmd, "ps"],
             cwd=root_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
+            close_fds=False,
         )
-        if ps_result.returncode != 0:
-            log(
-                "WARN",
-                "Команда docker compose ps завершилась с ошибкой. "
-                "Убедись, что Docker запущен и compose-файл корректный.",
-            )
     except FileNotFoundError as e:
         log("ERROR", f"Не удалось выполнить docker compose ps: {e}")
         return 1
@@ -229,15 +275,37 @@ def main() -> int:
         return 1
 
     # HTTP-проверка Nginx, чтобы убедиться, что Wiki.js доступен снаружи контейнеров
-    public_port = env_vars.get("PUBLIC_HTTP_PORT", "80")
-    target_url = f"http://localhost:{public_port}"
     log(
         "INFO",
         "Пробую HTTP-запрос к Nginx (ожидается 200/302). "
         f"URL: {target_url}",
     )
+    # Предупреждения HTTP-проверки собираем в список и логируем ниже, вместе с её итогом:
+    # так они стоят после вывода docker compose ps и учитываются в счётчике WARN
+    http_warnings: list = []
+    http_ok = check_http_endpoint(target_url, http_warnings.append)
+
+    # Показываем статус контейнеров (вывод docker compose ps собран целиком)
+    try:
+        ps_stdout, ps_stderr = ps_proc.communicate()
+        if ps_stdout:
+            pending_output.append((sys.stdout, ps_stdout))
+        if ps_stderr:
+            pending_output.append((sys.stderr, ps_stderr))
+        if ps_proc.returncode != 0:
+            log(
+                "WARN",
+                "Команда docker compose ps завершилась с ошибкой. "
+                "Убедись, что Docker запущен и compose-файл корректный.",
+            )
+    except Exception as e:
+        ps_proc.kill()
+        log("ERROR", f"Неожиданная ошибка при проверке docker compose ps: {e}")
+        return 1
 
-    if check_http_endpoint(target_url):
+    for text in http_warnings:
+        log("WARN", text)
+    if http_ok:
         log("OK", "Nginx отвечает на внешний порт. Wiki.js должен быть доступен.")
     else:
         log(